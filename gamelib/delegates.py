@@ -49,6 +49,8 @@ class InteractiveDelegate(object):
             def f(*args):
                 self.timer = None
                 callback(player)
+                # the look may have changed
+                self.entity.dirty = 1
                 player.unfreeze()
             self.game_state.game_time.schedule(timer, f, player)
             player.freeze()
@@ -4,7 +4,7 @@ from pygame.locals import *
 
 import pyknic
 
-from pyknic.collision import AABBCollisionStrategy
+from pyknic.collision import AABBCollisionStrategy, StaticIndexStrategy
 from pyknic.entity import Entity
 from pyknic.entity import Spr
 from pyknic.geometry import Vec3
@@ -12,13 +12,15 @@ from pyknic.geometry import Vec3
 from random import randint
 
 class InteractiveThing(pyknic.entity.Entity):
+    can_sleep = True
+
     @staticmethod
     def build_from_object(obj, state):
         thing = InteractiveThing(Rect(obj.x, obj.y, obj.width, obj.height), state)
         thing.properties = obj.properties
         thing.thing_type = obj.type
         state.actionables.append(thing.blow_up())
-        state.impassables.append(thing)
+        state.impassables.add(thing)
         state.game_time.event_update += thing.update
         return thing
 
@@ -31,6 +33,7 @@ class InteractiveThing(pyknic.entity.Entity):
         self.thing_type = None
         self.state = state
         self.impassables = state.impassables
+        self.sleeping = False
 
     def get_actions(self, player):
         t = self.get_thing()
@@ -66,37 +69,169 @@ class InteractiveThing(pyknic.entity.Entity):
         t = self.get_thing()
         t.render(screen_surf, offset, screen_offset)
 
+    def sleep(self):
+        if not self.sleeping:
+            self.sleeping = True
+            self.state.game_time.event_update -= self.update
+
+    def wake(self):
+        if self.sleeping:
+            self.sleeping = False
+            self.state.game_time.event_update += self.update
+
     def make_impassable(self):
-        self.impassables.append(self)
+        self.impassables.add(self)
 
     def make_passable(self):
-        if self in self.impassables:
-            self.impassables.remove(self)
+        self.impassables.remove(self)
+
+class LayerPiece(pyknic.entity.Entity):
+    u"""
+    A baked piece of a tile layer, rect is the part of the layer it shows.
+    Placed like the whole layer would be (the offset is truncated before 
+    adding the position), so neighbouring pieces never get a gap between
+    them.
+    """
+    def __init__(self, image, rect, layer):
+        Entity.__init__(self, Spr(image), Vec3(rect.x, rect.y))
+        self.rect = pygame.Rect(rect)
+        self.layer = layer
+
+    def render(self, screen_surf, offset=Vec3(0,0), screen_offset=Vec3(0,0)):
+        screen_surf.blit(self.spr.image, (self.rect.x + int(-offset.x), self.rect.y + int(-offset.y)))
+
+class Movement(object):
+    u"""
+    Moves all Enlightened axis by axis. After each axis step one collision
+    check is run for all movers together instead of one per mover.
+    It has to be added to the update event before the movers, so it runs 
+    after their update (think first, then move).
+
+    If walls (a StaticCollisionIndex) is given, the movers are swept 
+    against them instead: one query per mover and frame, sliding along the
+    walls, without tunnelling on big time steps. The other groups are 
+    checked once after moving.
+
+    If kinematics (a pyknic.kinematics.Kinematics) is given, the axis steps
+    are integrated for all movers in one batch.
+    """
+    def __init__(self, walls=None, kinematics=None):
+        self.collisions = pyknic.collision.CollisionSystem()
+        self.walls = walls
+        self.kinematics = kinematics
+        self._movers = []
+        self._suspended = {} # {mover: [(group name, callback)]}
+
+    def add(self, mover):
+        if mover not in self._movers:
+            self._movers.append(mover)
+            if self.kinematics is not None:
+                self.kinematics.add(mover)
+
+    def remove(self, mover):
+        if mover in self._movers:
+            self._movers.remove(mover)
+            if self.kinematics is not None:
+                self.kinematics.remove(mover)
+        self.collisions.remove(mover)
+
+    def suspend(self, mover):
+        u"""removes the mover, but remembers its collision groups for resume"""
+        if mover in self._movers:
+            self._suspended[mover] = self.collisions.groups_of(mover)
+            self.remove(mover)
+
+    def resume(self, mover):
+        groups = self._suspended.pop(mover, None)
+        if groups is not None:
+            self.add(mover)
+            for name, func in groups:
+                self.collisions.add(mover, name, func)
+
+    def update(self, gdt, gt, dt, t, *args, **kwargs):
+        movers = [mover for mover in self._movers if not mover.target]
+        if self.walls is not None:
+            for mover in movers:
+                mover.update_swept(gdt, self.walls)
+            self.collisions.check()
+            return
+        if self.kinematics is not None:
+            self.kinematics.integrate_x(gdt)
+            self.collisions.check()
+            self.kinematics.integrate_y(gdt)
+            self.collisions.check()
+            return
+        for mover in movers:
+            mover.update_x(gdt, gt, dt, t, *args)
+        self.collisions.check()
+        for mover in movers:
+            mover.update_y(gdt, gt, dt, t, *args)
+        self.collisions.check()
 
 class Enlightened(pyknic.entity.Entity):
+    can_sleep = True
+
     def __init__(self, position, state):
         super(Enlightened, self).__init__(None, position)
         self.state = state
+        self.sleeping = False
         self.layer = 10000
         self.moving = Vec3(0,0)
-        self.coll_detector = pyknic.collision.CollisionDetector()
+        self.state.movement.add(self)
         self.state.game_time.event_update += self.update
 
     def update(self, gdt, gt, dt, t, *args, **kwargs):
+        # moving and collision checking is done by the Movement of the state
         if self.target:
             self.position = self.target.position
             self.rect.center = self.position.as_xy_tuple()
-        else:
-            self.update_x(gdt, gt, dt, t, *args)
-            self.coll_detector.check()
-            self.update_y(gdt, gt, dt, t, *args)
-            self.coll_detector.check()
 
-    def collides_with(self, other_name, others, callback, other_class=Entity):
-        my_name = self.__class__.__name__.lower()
+    def sleep(self):
+        u"""stops updating and moving, e.g. while it is far from the player"""
+        if self.sleeping:
+            return
+        self.sleeping = True
+        self.state.game_time.event_update -= self.update
+        self.state.movement.suspend(self)
+        if getattr(self, 'light', None):
+            self.state.lighting.remove_light(self.light)
+
+    def wake(self):
+        if not self.sleeping:
+            return
+        self.sleeping = False
+        if getattr(self, 'light', None):
+            self.state.lighting.add_light(self.light)
+        self.state.movement.resume(self)
+        self.state.game_time.event_update += self.update
 
-        self.coll_detector.register_once(my_name, other_name, [self], others, \
-                    AABBCollisionStrategy(), (self.__class__, other_class), callback)
+    def collides_with(self, other_name, others, callback, coll_strategy=None):
+        collisions = self.state.movement.collisions
+        if not collisions.has_group(other_name):
+            collisions.register_group(other_name, others, coll_strategy)
+        collisions.add(self, other_name, callback)
+
+    def collides_with_walls(self, callback):
+        # in swept mode the walls are handled while moving, see update_swept
+        if self.state.movement.walls is None:
+            self.collides_with('walls', self.state.impassables, callback, StaticIndexStrategy())
+
+    def update_swept(self, gdt, walls):
+        dt = gdt * self.t_speed
+        self.velocity += self.t_speed * dt * self.acceleration
+        w, h = self.rect.size
+        box = (self.position.x - w / 2.0, self.position.y - h / 2.0, w, h)
+        box, contacts = walls.slide(box, self.t_speed * dt * self.velocity.x, \
+                    self.t_speed * dt * self.velocity.y)
+        self.moving = Vec3(self.velocity.x, self.velocity.y)
+        self.position = Vec3(box[0] + w / 2.0, box[1] + h / 2.0)
+        self.rect.center = self.position.as_xy_tuple()
+        for wall, normal in contacts:
+            self.wall_contact(wall, normal)
+
+    def wall_contact(self, wall, normal):
+        u"""called in swept mode when hitting a wall, normal points away from the wall"""
+        pass
 
     def update_x(self, gdt, gt, dt, t, *args, **kwargs):
         dt = gdt * self.t_speed
@@ -105,6 +240,7 @@ class Enlightened(pyknic.entity.Entity):
         self.moving.x = self.velocity.x
         self.moving.y = 0
         self.rect.center = self.position.as_xy_tuple()
+        self.dirty = 1
 
     def update_y(self, gdt, gt, dt, t, *args, **kwargs):
         dt = gdt * self.t_speed
@@ -113,6 +249,7 @@ class Enlightened(pyknic.entity.Entity):
         self.moving.x = 0
         self.moving.y = self.velocity.y
         self.rect.center = self.position.as_xy_tuple()
+        self.dirty = 1
 
     @staticmethod
     def factory(objekt, state):
@@ -130,6 +267,8 @@ class Enlightened(pyknic.entity.Entity):
 
 
 class Player(Enlightened):
+    can_sleep = False
+
     def __init__(self, position, state):
         super(Player, self).__init__(position, state)
         self.money = 0
@@ -145,7 +284,7 @@ class Player(Enlightened):
         self.spr = self.sprites[pyknic.utilities.utilities.Direction.N]
         self.rect.size = self.spr.image.get_size()
 
-        self.collides_with('walls', self.state.impassables, self.coll_player_wall)
+        self.collides_with_walls(self.coll_player_wall)
 
         self.state.events.key_down += self.on_key_down
         self.state.events.key_up += self.on_key_up
@@ -246,10 +385,16 @@ class ActionMenu(pyknic.entity.Entity):
         self.visible = False
         self.layer = 1000000
         self.actionable_detector = pyknic.collision.CollisionDetector()
-        self.actionable_detector.register_once('player', 'stuff', [self.player], actionables, \
-                    AABBCollisionStrategy(), (Player, InteractiveThing), self.coll_player_stuff)
+        self.actionable_detector.register_group('player', [self.player])
+        self.actionable_detector.register_group('stuff', actionables)
+        self.actionable_detector.register_pair('player', 'stuff', AABBCollisionStrategy())
+        self.actionable_detector.register_contact_funcs((Player, InteractiveThing), \
+                    on_enter=self.enter_player_stuff, on_exit=self.exit_player_stuff)
+        self.actionables = actionables
+        self.in_range = []
         self.items = []
         self.names = []
+        self._built = None
 
     def on_key_down(self, key, mod, code):
         if code != 'a':
@@ -266,32 +411,53 @@ class ActionMenu(pyknic.entity.Entity):
             self.update_items()
 
     def update_items(self):
+        shown = self.visible
         if self.visible == True:
             self.items = []
             self.names = []
-            # update menu
+            # update menu, only things entering or leaving the range are reported
             self.actionable_detector.check()
+            for thing in self.in_range:
+                a = thing.get_actions(self.player)
+                self.names.extend([thing.label()] * len(a))
+                self.items.extend(a)
         if not self.items:
             self.visible = False
+        if self.visible:
+            self.build_image()
+        if self.visible != shown:
+            self.dirty = 1
 
 
-    def coll_player_stuff(self, player, thing):
-        a = thing.get_actions(player)
-        self.names.extend([thing.label()] * len(a))
-        self.items.extend(a)
+    def enter_player_stuff(self, player, thing):
+        self.in_range.append(thing)
+        # keep the menu order of the actionables
+        self.in_range.sort(key=self.actionables.index)
+
+    def exit_player_stuff(self, player, thing):
+        self.in_range.remove(thing)
 
     def update(self, gdt, gt, dt, t, *args, **kwargs):
         self.update_items()
+        # follow the player, so the renderer finds the menu in the view
+        rect = pygame.Rect((self.player.position.x + 10, self.player.position.y + 10), self.spr.image.get_size())
+        if rect != self.rect:
+            self.rect = rect
+
+    def hit(self, world_coord):
+        return self.visible and self.rect.collidepoint(world_coord.as_xy_tuple())
+
+    def build_image(self):
+        # only if the items have changed, a new image needs a redraw
+        built = (self.names, [item for item, _ in self.items])
+        if built == self._built:
+            return
+        self._built = built
+        self.dirty = 1
 
-    def render(self, screen_surf, offset=Vec3(0,0), screen_offset=Vec3(0,0)):
         item_height = 10
         name_height = 15
         min_width = 90
-        if not self.visible:
-            return
-        # align to player
-        self.position = Vec3(self.player.position.x+10, self.player.position.y +10)
-
         # setup sprite for menu
         height = 50 + len(self.items) * item_height + \
                 len(set(self.names)) * name_height
@@ -325,6 +491,14 @@ class ActionMenu(pyknic.entity.Entity):
             self.spr.image.blit(text,(10,y))
             y += item_height
 
+    def render(self, screen_surf, offset=Vec3(0,0), screen_offset=Vec3(0,0)):
+        if not self.visible:
+            return
+        # align to player
+        position = (self.player.position.x + 10, self.player.position.y + 10)
+        if position != self.position.as_xy_tuple():
+            self.position = Vec3(*position)
+
         # actually render
         Entity.render(self, screen_surf, offset)
 
@@ -345,7 +519,8 @@ class Guard(Enlightened):
         self.switch_random_direction()
         self.steps_made = 0
 
-        self.collides_with('walls', [self.state.player]+self.state.impassables, self.collidate_wall)
+        self.collides_with_walls(self.collidate_wall)
+        self.collides_with('player', [self.state.player], self.collidate_wall)
         self.light = self.state.lighting.create_light(self, True, (100,100))
 
     def switch_random_direction(self, wrong_direction=0):
@@ -395,6 +570,10 @@ class Guard(Enlightened):
     def collidate_wall(self, player, wall, dummy = 0):
         self.collision_response(wall)
 
+    def wall_contact(self, wall, normal):
+        # same directions as in collision_response
+        self.switch_random_direction({(-1, 0): 0, (1, 0): 1, (0, -1): 2, (0, 1): 3}[normal])
+
     def update(self, gdt, gt, dt, t, *args, **kwargs):
         super(Guard, self).update(gdt, gt, dt, t, *args, **kwargs)
 
@@ -415,6 +594,8 @@ class Lighting(object):
         self._lights = []
         self.layer = 999999
         self.position =Vec3(0,0,0)
+        # reused each frame, only the used part is cleared
+        self._fog = None
 
     def create_light(self, obj, enabled, size, offset=Vec3(0,0)):
         light = Light(obj)
@@ -425,26 +606,51 @@ class Lighting(object):
         self._lights.append(light)
         return light
 
+    def add_light(self, light):
+        if light not in self._lights:
+            self._lights.append(light)
+
+    def remove_light(self, light):
+        if light in self._lights:
+            self._lights.remove(light)
+
 
     def render(self, screen_surf, offset=Vec3(0,0), screen_offset=Vec3(0,0)):
-        fog = pygame.Surface(screen_surf.get_rect().size, pygame.SRCALPHA)
+        # only the clip area needs the fog
+        area = screen_surf.get_clip()
+        if self._fog is None or self._fog.get_size() != screen_surf.get_size():
+            self._fog = pygame.Surface(screen_surf.get_size(), pygame.SRCALPHA)
+        fog = self._fog.subsurface(pygame.Rect((0, 0), area.size))
         fog.fill((0,0,0,150))
 
         for light in self._lights:
-            light.render(fog, offset)
+            light.render(fog, offset, area.topleft)
 
-        screen_surf.blit(fog, (0,0))
+        screen_surf.blit(fog, area.topleft)
 
 class Light(object):
+    # shared by all lights: {path: texture}, {(path, size): scaled texture}
+    _textures = {}
+    _images = {}
+
     def __init__(self, entity = None):
         self.attached = entity
         self.enabled = True
         self.size = (200,200)
         self.offset = Vec3(0,0)
-        self._light_image = pygame.image.load("data/images/player_light.png").convert_alpha()
+        self.texture = "data/images/player_light.png"
 
     def img(self):
-        return pygame.transform.scale(self._light_image, self.size)
+        key = (self.texture, tuple(self.size))
+        image = Light._images.get(key)
+        if image is None:
+            texture = Light._textures.get(self.texture)
+            if texture is None:
+                texture = pygame.image.load(self.texture).convert_alpha()
+                Light._textures[self.texture] = texture
+            image = pygame.transform.scale(texture, key[1])
+            Light._images[key] = image
+        return image
 
     def sprite_offset(self):
         return Vec3((self.size[0]/2), (self.size[1]/2))
@@ -452,8 +658,10 @@ class Light(object):
     def position(self):
         return self.attached.position - self.sprite_offset() + self.offset
 
-    def render(self, surface, offset):
-        surface.blit(self.img(), (self.position() - offset).as_xy_tuple(), None, pygame.BLEND_RGBA_SUB)
+    def render(self, surface, offset, origin=(0, 0)):
+        # truncated like a blit to the screen would, before moving to origin
+        pos = self.position() - offset
+        surface.blit(self.img(), (int(pos.x) - origin[0], int(pos.y) - origin[1]), None, pygame.BLEND_RGBA_SUB)
 
 class LurkingGuard(Enlightened):
     def __init__(self, position, state):
@@ -475,8 +683,8 @@ class LurkingGuard(Enlightened):
         self.random_move = False
         self.find_direction()
 
-        self.collides_with('walls', self.state.impassables, self.collidate_wall)
-        self.collides_with('player', [self.state.player], self.collidate_player, Player)
+        self.collides_with_walls(self.collidate_wall)
+        self.collides_with('player', [self.state.player], self.collidate_player)
 
         self.light = self.state.lighting.create_light(self, True, (150,150))
 
@@ -493,33 +701,14 @@ class LurkingGuard(Enlightened):
         pos_x = self.position.x
         pos_y = self.position.y
         lurk_rect = pygame.Rect(pos_x - 75, pos_y - 75, 150, 150)
-        entities = self.world.get_entities_in_region(lurk_rect)
         found_player = None
-        for e in entities:
-            if isinstance(e, Player):
-                found_player = e
+        if lurk_rect.colliderect(self.state.player.rect):
+            found_player = self.state.player
         if found_player:
             self.random_move = False
             p_pos_x = found_player.position.x
             p_pos_y = found_player.position.y
-            if p_pos_x<pos_x:
-                left = p_pos_x
-                width = pos_x-p_pos_x
-            else:
-                left = pos_x
-                width = p_pos_x-pos_x
-            if p_pos_y<pos_y:
-                top = p_pos_y
-                height = pos_y-p_pos_y
-            else:
-                top = pos_y
-                height = p_pos_y-pos_y
-            check_rect = pygame.Rect(left, top, width, height)
-            e_collision=False
-            for e in entities:
-                if not isinstance(e, (Player, Guard, LurkingGuard)):
-                    if check_rect.colliderect(e.rect) and e in self.impassables:
-                            e_collision=True
+            e_collision = self.impassables.raycast(pos_x, pos_y, p_pos_x, p_pos_y) is not None
             v_x = p_pos_x-pos_x
             v_y = p_pos_y-pos_y
             if v_x>max_speed or v_y>max_speed:
@@ -569,6 +758,9 @@ class LurkingGuard(Enlightened):
 
         self.find_direction()
 
+    def wall_contact(self, wall, normal):
+        self.find_direction()
+
     def collidate_wall(self, player, wall, dummy = 0):
         self.collision_response(wall)
 
@@ -605,8 +797,8 @@ class PatrollingGuard(Enlightened):
             self.normal_velocity = Vec3(0, self.speed)
         self.velocity = self.normal_velocity                # initial velocity
 
-        self.collides_with('walls', self.state.impassables, self.collidate_wall)
-        self.collides_with('player', [self.state.player], self.collidate_player, Player)
+        self.collides_with_walls(self.collidate_wall)
+        self.collides_with('player', [self.state.player], self.collidate_player)
 
         self.light = self.state.lighting.create_light(self, True, (200,200))
 
@@ -691,6 +883,10 @@ class PatrollingGuard(Enlightened):
         self.moving = Vec3(0,0)
         self.position = Vec3(*self.rect.center)
 
+    def wall_contact(self, wall, normal):
+        # turn around, same as in collision_response
+        self.velocity = Vec3(normal[0] * self.speed, normal[1] * self.speed)
+
     def collidate_wall(self, player, wall, dummy = 0):
         self.collision_response(wall)
 
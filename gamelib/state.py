@@ -2,14 +2,17 @@
 import pygame
 
 import pyknic
-from pyknic.entity import Entity, Spr
+from pyknic.entity import Entity
 from pyknic.geometry import Vec3
 from pyknic.resources.tiledtmxloader import TileMapParser, ImageLoaderPygame
-from pyknic.collision import AABBCollisionStrategy
+from pyknic.collision import AABBCollisionStrategy, StaticCollisionIndex, merge_tiles
+from pyknic.kinematics import Kinematics
+from pyknic.world import ChunkStreamer
+from pyknic.renderer import DirtyRects
 
 
 from world import TheWorld
-from entities import InteractiveThing, Player, Enlightened, Lighting
+from entities import InteractiveThing, Player, Enlightened, Lighting, Movement, LayerPiece
 
 from ui import SimpleRenderer, StatusBar
 
@@ -17,6 +20,11 @@ import pygame
 import os
 import glob
 
+# maps with more pixels are streamed in chunks
+STREAMING_AREA = 4096 * 4096
+# the things are drawn on this layer, the tile layers below are background
+THINGS_LAYER = 100
+
 def rect_copy(rect):
     if hasattr(pygame.Rect, 'copy'):
         return rect.copy()
@@ -94,81 +102,84 @@ class PlayState(pyknic.State):
         self.game_time = pyknic.timing.GameTime()
         self.remaining = self.time = 42
         self.level = level
+        self.dirty_rects = None
 
 
     def on_init(self, app):
         world_map = TileMapParser().parse_decode_load(self.level, ImageLoaderPygame())
         assert world_map.orientation == "orthogonal"
-        self.impassables = []
+        self.impassables = StaticCollisionIndex()
         self.actionables = []
         self.lighting = Lighting()
+        # subscribed first, so the region index is updated after everything has moved
+        self.game_time.event_update += self.world.update
+        # subscribed before the movers are created, so it runs after them
+        if world_map.properties.get('collision') == 'swept':
+            self.movement = Movement(self.impassables)
+        elif world_map.properties.get('kinematics') == 'batch':
+            self.movement = Movement(kinematics=Kinematics())
+        else:
+            self.movement = Movement()
+        self.game_time.event_update += self.movement.update
         try:
             self.remaining = self.time = int(world_map.properties['time'])
         except KeyError, e:
             # Keep default
             pass
+        self.world_map = world_map
+        self.tile_images = {}
+        # how far a tile image may reach out of its cell
+        self.tile_overlap = max([abs(offx) + img.get_width() for offx, offy, img in world_map.indexed_tiles.values()] + \
+                                [abs(offy) + img.get_height() for offx, offy, img in world_map.indexed_tiles.values()])
+        self.visible_layers = []
         for layernum, layer in enumerate(world_map.layers[:]):
             if layer.visible:
-                layer_img = pygame.Surface((layer.pixel_width, layer.pixel_height), pygame.SRCALPHA)
-                idx = 0
-
                 impassable = False
                 try:
                     impassable = layer.properties['passable'] == 'false'
                 except KeyError:
                     pass
-
-                spr = Spr()
-                for y in xrange(0, layer.pixel_height, world_map.tileheight):
-                    for x in xrange(0, layer.pixel_width, world_map.tilewidth):
-                        img_idx = layer.decoded_content[idx]
-                        idx += 1
-                        if img_idx:
-                            offx, offy, screen_img = world_map.indexed_tiles[img_idx]
-
-                            if impassable:
-                                ent = Entity(None, Vec3(x + offx, y + offy))
-                                ent.rect.size = screen_img.get_size()
-                                ent.layer = layernum * 10
-                                self.impassables.append(ent)
-
-                            screen_img = screen_img.convert()
-                            if layer.opacity > -1:
-                                screen_img.set_alpha(None)
-                                alpha_value = int(255. * float(layer.opacity))
-                                screen_img.set_alpha(alpha_value)
-                            layer_img.blit(screen_img.convert(), (x + offx, y + offy))
-
-                layer_img.set_alpha(int(255. * float(abs(layer.opacity))))
-                spr = Spr(layer_img.convert_alpha())
-                ent = Entity(spr, Vec3(0,0))
-                ent.rect = layer_img.get_rect()
-                ent.layer = layernum * 10
-                self.world.add_entity(ent)
+                if impassable:
+                    self.add_walls(layer, layernum)
+                self.visible_layers.append((layernum, layer))
                 self.game_time.schedule_repeated(0.1, self.update_time)
 
+        # the layer images are baked in chunks around the camera, the least
+        # recently seen are dropped above the budget. On big maps the things
+        # are added to the world and put to sleep chunk by chunk too. What
+        # blocks (walls, doors, windows) is registered for the whole map.
+        self.stream_things = world_map.properties.get('streaming') == 'chunks' or \
+                world_map.pixel_width * world_map.pixel_height > STREAMING_AREA
+        chunk_size = int(world_map.properties.get('chunk_size', 256))
+        budget = int(world_map.properties.get('chunk_budget', 32)) * 2 ** 20
+        self.streamer = ChunkStreamer(chunk_size, self.load_chunk, self.unload_chunk, budget, chunk_size // 2)
+
         # map objects
+        self.pending_objects = {} # {chunk key: [map object]}, not yet created
+        self.parked = {}          # {chunk key: [entity]}, sleeping in unloaded chunks
+        self.streamed = set()     # awake entities of loaded chunks
         for obj_group in world_map.object_groups:
             for obj in obj_group.objects:
                 if hasattr(obj, 'type'):
-                    thing = None
-                    if obj.type == 'Player':
-                        self.player = thing = Enlightened.factory(obj, self)
-
-                    elif obj.type in ['LurkingGuard', 'Guard', 'PatrollingGuard']:
-                        thing = Enlightened.factory(obj, self)
-
+                    if not self.stream_things or obj.type == 'Player':
+                        self.world.add_entity(self.create_thing(obj))
+                        continue
+                    key = self.streamer.chunk_of(obj.x, obj.y)
+                    if obj.type in ['LurkingGuard', 'Guard', 'PatrollingGuard']:
+                        self.pending_objects.setdefault(key, []).append(obj)
                     else:
-                        thing = InteractiveThing.build_from_object(obj, self)
-
-                    self.world.add_entity(thing)
+                        # blocks the guards and their sight outside of the
+                        # loaded chunks too, so only parked until then
+                        thing = self.create_thing(obj)
+                        thing.sleep()
+                        self.parked.setdefault(key, []).append(thing)
 
         display_rect = pygame.display.get_surface().get_rect()
 
         renderer_rect = rect_copy(display_rect)
         renderer_rect.height -= 50
 
-        renderer1 = SimpleRenderer(self, renderer_rect)
+        self.renderer = renderer1 = SimpleRenderer(self, renderer_rect)
         self.world.add_renderer(renderer1)
 
         scoreboard_rect = rect_copy(display_rect)
@@ -179,7 +190,163 @@ class PlayState(pyknic.State):
         self.game_time.event_update += scoreboard.update
         self.world.add_renderer(scoreboard)
 
+        # only the changed parts of the screen are pushed to the display
+        if self.the_app.config['display']['dirty_rects']:
+            self.dirty_rects = DirtyRects(display_rect)
+            renderer1.dirty_rects = self.dirty_rects
+            scoreboard.dirty_rects = self.dirty_rects
+
+        # the things far from the player sleep
+        radius = world_map.properties.get('activity_radius', 1024)
+        if radius != 'off':
+            self.world.set_activity_region(self.player, int(radius))
+
         self.setup_update_events()
+        self.stream()
+
+    def add_walls(self, layer, layernum):
+        world_map = self.world_map
+        blocked = set()
+        idx = 0
+        for y in xrange(0, layer.pixel_height, world_map.tileheight):
+            for x in xrange(0, layer.pixel_width, world_map.tilewidth):
+                img_idx = layer.decoded_content[idx]
+                idx += 1
+                if img_idx:
+                    offx, offy, screen_img = world_map.indexed_tiles[img_idx]
+                    if offx == 0 and offy == 0 and \
+                            screen_img.get_size() == (world_map.tilewidth, world_map.tileheight):
+                        # merged into bigger rects below
+                        blocked.add((x // world_map.tilewidth, y // world_map.tileheight))
+                    else:
+                        ent = Entity(None, Vec3(x + offx, y + offy))
+                        ent.rect.size = screen_img.get_size()
+                        ent.layer = layernum * 10
+                        self.impassables.add(ent)
+
+        for rect in merge_tiles(blocked, world_map.tilewidth, world_map.tileheight):
+            ent = Entity(None, Vec3(rect.x, rect.y))
+            ent.rect.size = rect.size
+            ent.layer = layernum * 10
+            self.impassables.add(ent)
+
+    def tile_image(self, layer, img_idx):
+        # converted once per layer and tile instead of once per placed tile
+        key = (id(layer), img_idx)
+        if key not in self.tile_images:
+            offx, offy, screen_img = self.world_map.indexed_tiles[img_idx]
+            screen_img = screen_img.convert()
+            if layer.opacity > -1:
+                screen_img.set_alpha(None)
+                alpha_value = int(255. * float(layer.opacity))
+                screen_img.set_alpha(alpha_value)
+            self.tile_images[key] = (offx, offy, screen_img.convert())
+        return self.tile_images[key]
+
+    def bake_layer(self, layer, layernum, rect):
+        u"""
+        Draws the tiles of the layer in rect (world coordinates) into an 
+        entity covering rect. Returns None if there is nothing to draw.
+        """
+        world_map = self.world_map
+        tilewidth = world_map.tilewidth
+        tileheight = world_map.tileheight
+        # tiles may be bigger than a cell and offset, so look at the cells
+        # around rect too, blit clips what does not belong to rect
+        overlap = self.tile_overlap
+        left = max(0, (rect.left - overlap) // tilewidth)
+        right = min(layer.width, (rect.right + overlap) // tilewidth + 1)
+        top = max(0, (rect.top - overlap) // tileheight)
+        bottom = min(layer.height, (rect.bottom + overlap) // tileheight + 1)
+
+        layer_img = pygame.Surface(rect.size, pygame.SRCALPHA)
+        content = layer.decoded_content
+        empty = True
+        for ty in xrange(top, bottom):
+            idx = ty * layer.width + left
+            y = ty * tileheight - rect.top
+            for tx in xrange(left, right):
+                img_idx = content[idx]
+                idx += 1
+                if img_idx:
+                    offx, offy, screen_img = self.tile_image(layer, img_idx)
+                    if layer_img.blit(screen_img, (tx * tilewidth - rect.left + offx, y + offy)):
+                        empty = False
+        if empty:
+            return None
+
+        layer_img.set_alpha(int(255. * float(abs(layer.opacity))))
+        return LayerPiece(layer_img.convert_alpha(), rect, layernum * 10)
+
+    def flatten(self, pieces, rect):
+        u"""
+        Draws the pieces on black, the same as drawing them on the cleared
+        screen. Only for the pieces that are drawn first.
+        """
+        image = pygame.Surface(rect.size).convert()
+        image.fill((0, 0, 0))
+        for piece in pieces:
+            image.blit(piece.spr.image, (0, 0))
+        return LayerPiece(image, rect, pieces[0].layer)
+
+    def create_thing(self, obj):
+        if obj.type == 'Player':
+            self.player = thing = Enlightened.factory(obj, self)
+        elif obj.type in ['LurkingGuard', 'Guard', 'PatrollingGuard']:
+            thing = Enlightened.factory(obj, self)
+        else:
+            thing = InteractiveThing.build_from_object(obj, self)
+        return thing
+
+    def stream(self):
+        u"""loads the chunks around the camera, puts the things of unloaded chunks to sleep"""
+        view_rect = pygame.Rect((0, 0), self.renderer.rect.size)
+        view_rect.center = self.player.position.as_xy_tuple()
+        streamer = self.streamer
+        streamer.update(view_rect)
+        if not self.stream_things:
+            return
+        for thing in list(self.streamed):
+            key = streamer.chunk_of(thing.position.x, thing.position.y)
+            if key not in streamer:
+                # walked out of the loaded chunks or its chunk has been unloaded
+                self.streamed.remove(thing)
+                self.world.remove_entity(thing)
+                thing.sleep()
+                self.parked.setdefault(key, []).append(thing)
+
+    def load_chunk(self, key):
+        # clipped like the whole layer would be
+        rect = self.streamer.chunk_rect(key).clip(0, 0, self.world_map.pixel_width, self.world_map.pixel_height)
+        layers = []
+        size = 0
+        if rect.w and rect.h:
+            for layernum, layer in self.visible_layers:
+                ent = self.bake_layer(layer, layernum, rect)
+                if ent:
+                    layers.append(ent)
+            # nothing is drawn between the background layers, so they are 
+            # merged into one opaque surface, one blit per frame
+            background = [ent for ent in layers if ent.layer < THINGS_LAYER]
+            if background:
+                layers = [self.flatten(background, rect)] + layers[len(background):]
+            for ent in layers:
+                self.world.add_entity(ent)
+                size += rect.w * rect.h * ent.spr.image.get_bytesize()
+        for obj in self.pending_objects.pop(key, []):
+            thing = self.create_thing(obj)
+            self.world.add_entity(thing)
+            self.streamed.add(thing)
+        for thing in self.parked.pop(key, []):
+            thing.wake()
+            self.world.add_entity(thing)
+            self.streamed.add(thing)
+        return layers, size
+
+    def unload_chunk(self, key, layers):
+        # the things are put to sleep by stream()
+        for ent in layers:
+            self.world.remove_entity(ent)
 
     def setup_update_events(self):
         self.game_time.event_update += self.update
@@ -187,13 +354,18 @@ class PlayState(pyknic.State):
 
     def render(self, gdt, gt, dt, t, get_surface=pygame.display.get_surface, flip=pygame.display.flip):
         screen_surf = get_surface()
+        if self.dirty_rects is not None:
+            # the renderers redraw and report what has changed
+            self.world.render(screen_surf)
+            self.dirty_rects.update()
+            return
         screen_surf.fill((0, 0, 0))
         self.world.render(screen_surf)
         flip()
 
 
     def update(self, gdt, gt, dt, t, *args):
-        pass
+        self.stream()
 
     def game_over(self):
         self.the_app.replace_state(GameOverState(self.player.money))
@@ -4,16 +4,36 @@ import datetime
 import pyknic, pygame
 from pygame.locals import *
 from pyknic.geometry import Vec3
-from pyknic.utilities import SortedList
+from pyknic.renderer import DrawList
 from pyknic.timing import GameTime
 from pyknic.resources.tiledtmxloader import TileMapParser, ImageLoaderPygame
 
 class SimpleRenderer(pyknic.renderer.IRenderer):
 
+    # sprites may be drawn a bit outside of the rect of their entity
+    cull_margin = 64
+
     def __init__(self, state, cam_rect):
         super(SimpleRenderer, self).__init__(cam_rect)
         self.state = state
         self.target = self.state.player
+        # draw order keys kept between the frames, the world reports the changes
+        self.draw_list = DrawList([self.state.lighting])
+        # dirty rects mode: what has been drawn where in the last frame
+        self._view = None
+        self._drawn = {} # {entity or light: Rect on the renderer}
+        self._changed = set()
+
+    def on_entity_added(self, entity):
+        self.draw_list.add(entity)
+
+    def on_entity_removed(self, entity):
+        self.draw_list.remove(entity)
+
+    def on_entities_changed(self, entities):
+        self.draw_list.update(entities)
+        if self.dirty_rects is not None:
+            self._changed.update(entities)
 
     def render(self, screen_surf, offset=None):
         self.position = self.target.position
@@ -22,13 +42,89 @@ class SimpleRenderer(pyknic.renderer.IRenderer):
             clipped_surf = screen_surf.subsurface(self.rect)
             offset = (self.position - self.vec_center)
 
-            #search_rect = self.rect.move(offset.as_xy_tuple())
-            #ents = SortedList(self._world.get_entities_in_region(search_rect), lambda e: -e.position.z + e.layer)
-
-            layers = [self.state.lighting] + self._world._entities
-
-            for layer in SortedList(layers, lambda e: -e.position.z + e.layer):
-                layer.render(clipped_surf, offset)
+            # index and draw list may miss changes since the last world 
+            # update, e.g. by an event handler
+            self._world.update_entities()
+            search_rect = pygame.Rect((int(offset.x), int(offset.y)), self.rect.size)
+            search_rect.inflate_ip(2 * self.cull_margin, 2 * self.cull_margin)
+            # sorted once, by the query
+            key = self.draw_list.key
+            ents = self._world.get_entities_in_region(search_rect, key)
+            lighting = self.state.lighting
+            idx = len(ents)
+            while idx and key(ents[idx - 1]) > key(lighting):
+                idx -= 1
+            ents.insert(idx, lighting)
+
+            if self.dirty_rects is None:
+                for layer in ents:
+                    layer.render(clipped_surf, offset)
+            else:
+                self.render_dirty(clipped_surf, offset, ents)
+
+    def render_dirty(self, clipped_surf, offset, ents):
+        # redraws only the areas that have changed since the last frame
+        view = (int(offset.x), int(offset.y))
+        lighting = self.state.lighting
+        drawn = {}
+        for ent in ents:
+            if ent is not lighting:
+                drawn[ent] = self.drawn_rect(ent, offset, view)
+        for light in lighting._lights:
+            rect = pygame.Rect((light.position() - offset).as_xy_tuple(), light.size)
+            drawn[light] = rect.inflate(2, 2)
+
+        if view != self._view:
+            # scrolled, everything has moved
+            areas = [clipped_surf.get_rect()]
+        else:
+            areas = []
+            old = self._drawn
+            changed = self._changed
+            for key, rect in drawn.iteritems():
+                old_rect = old.get(key)
+                if old_rect is None:
+                    areas.append(rect)
+                elif old_rect != rect or key in changed:
+                    areas.append(old_rect)
+                    areas.append(rect)
+            for key, rect in old.iteritems():
+                if key not in drawn:
+                    areas.append(rect)
+        self._view = view
+        self._drawn = drawn
+        self._changed = set()
+
+        # overlapping areas are drawn as one
+        merged = []
+        view_rect = clipped_surf.get_rect()
+        for area in areas:
+            area = area.clip(view_rect)
+            if area.w and area.h:
+                idx = area.collidelist(merged)
+                while idx != -1:
+                    area.union_ip(merged.pop(idx))
+                    idx = area.collidelist(merged)
+                merged.append(area)
+
+        for area in merged:
+            clipped_surf.set_clip(area)
+            clipped_surf.fill((0, 0, 0))
+            for layer in ents:
+                if layer is lighting or drawn[layer].colliderect(area):
+                    layer.render(clipped_surf, offset)
+            self.dirty_rects.add(area.move(self.rect.topleft))
+        clipped_surf.set_clip(None)
+
+    def drawn_rect(self, entity, offset, view):
+        # the region of the renderer the entity draws on, with some room for
+        # rounding. Things drawing themselves may draw outside of their rect.
+        rect = entity.rect.move(-view[0], -view[1])
+        if entity.spr is not None and entity.spr.image.get_width():
+            image = entity.spr.image
+            pos = entity.position - offset - entity.spr.offset
+            return rect.union(pygame.Rect((pos.x, pos.y), image.get_size())).inflate(4, 4)
+        return rect.inflate(2 * self.cull_margin, 2 * self.cull_margin)
 
 
 
@@ -53,8 +149,16 @@ class StatusBar(pyknic.renderer.IRenderer):
         super(StatusBar, self).__init__(cam_rect)
         self.state = state
         self.player = self.state.player
+        self._shown = None
 
     def render(self, screen_surf, offset=None):
+        if self.dirty_rects is not None:
+            # only redrawn if one of the values has changed
+            shown = (self.player.money, self.player.energy, int(self.state.get_remaining_time()))
+            if shown == self._shown:
+                return
+            self._shown = shown
+            self.dirty_rects.add(self.rect)
         clipped_surf = screen_surf.subsurface(self.rect)
         clipped_surf.fill((255,255,0))
 
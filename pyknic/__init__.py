@@ -98,6 +98,7 @@ import pyknic.collision
 import pyknic.default
 import pyknic.entity
 import pyknic.events
+import pyknic.kinematics
 import pyknic.renderer
 import pyknic.timing
 import pyknic.world
@@ -646,6 +647,8 @@ class Application(object):
                 cur_state_events.video_expose()
             else:
                 cur_state_events.unknown(event)
+        # once per frame, however many motion events there were
+        screen_mouse.update_hover()
 
 
 #-------------------------------------------------------------------------------
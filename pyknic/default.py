@@ -3,5 +3,6 @@ display = {
     'width'  : 640,
     'height' : 480,
     'caption': 'Default Pyknic Caption',
+    'dirty_rects': False,
     }
 paths = {'screenshots': 'screenshots'}
@@ -60,9 +60,29 @@ class Entity(object):
             The list of attached things, should be `Entity`
         dirty : int
             Indicates that the entity has moved, changed, layer changed so it has
-            to be redrawn. Usage depends on the renderer used.
+            to be redrawn. Usage depends on the renderer used. Assigning position,
+            rect or layer sets it, changing them in place does not, so set it
+            after e.g. rect.center = pos. The world collects the dirty entities
+            to update its index and clears the flag.
+        collision_category : int
+            Bitfield of the collision categories this entity belongs to. 
+            Default: 1
+        collision_mask : int
+            Bitfield of the collision categories this entity collides with.
+            Default: ~0, all categories
+        can_sleep : bool
+            If True, the world puts the entity to sleep while it is outside 
+            of the activity region, see `IWorld.set_activity_region`.
+            Default: False
         
     """
+
+    collision_category = 1
+    collision_mask = ~0
+    can_sleep = False
+
+    _dirty_set = None # set of the world this entity is in, see dirty
+
     def __init__(self, spr=None, position=None, velocity=None, acceleration=None, coll_rect = None):
         u"""
         Constructor.
@@ -106,6 +126,22 @@ class Entity(object):
         self.attachements = []
         self._target = None
 
+    def _set_dirty(self, value):
+        self._dirty = value
+        if value and self._dirty_set is not None:
+            self._dirty_set.add(self)
+    dirty = property(lambda self: self._dirty, _set_dirty, doc=u'get/set dirty flag, setting it reports the entity to its world')
+
+    def _set_position(self, position):
+        self._position = position
+        self.dirty = 1
+    position = property(lambda self: self._position, _set_position, doc=u'get/set the world position, setting it marks the entity dirty')
+
+    def _set_rect(self, rect):
+        self._rect = rect
+        self.dirty = 1
+    rect = property(lambda self: self._rect, _set_rect, doc=u'get/set the collision rect, setting it marks the entity dirty')
+
     def _set_target(self, target):
         self._target = target
     target = property(lambda self: self._target, _set_target, doc=u'get/set a target to follow or None, entities with target set has to handle them in their custom code')
@@ -172,6 +208,21 @@ class Entity(object):
         """
         screen_surf.blit(self.spr.image, (self.position - offset - self.spr.offset).as_xy_tuple(), self.spr.source_rect, self.spr.blendmode)
 
+    def sleep(self):
+        u"""
+        Called by the world when the entity leaves the activity region.
+        Should stop the updates of the entity, e.g. by unsubscribing them.
+        Default does nothing.
+        """
+        pass
+
+    def wake(self):
+        u"""
+        Called by the world when the entity enters the activity region 
+        again, undoes `sleep`. Default does nothing.
+        """
+        pass
+
     # Q: should update and render take care of attachemens or not? 
     # A: no, each entity has to handle the target itself
     def attach(self, entity):
@@ -56,6 +56,9 @@ class ScreenMouse(pyknic.entity.Entity):
             the topmost entity the mouse is currently over (that returns hit() == True)
         hover_renderer : renderer
             the topmost renderer the mouse is currently over (that returns hit() == True)
+        
+    The hover_entity is resolved in `update_hover`, which the app calls once 
+    per frame after dispatching the events, not on each motion event.
     
     
     :TODO:
@@ -77,6 +80,7 @@ class ScreenMouse(pyknic.entity.Entity):
         self.collision_rect_offset = Vec3(0, 0)
         self.hover_entity = None
         self.hover_renderer = None
+        self._hover_pending = None # (world, dragging) to pick from in update_hover
         #-- unsure --#
         # TODO: add default sprite
 #        self.position = None
@@ -164,22 +168,9 @@ class ScreenMouse(pyknic.entity.Entity):
                     self.position = renderer.screen_to_world(self.screen_pos)
                     if self.position:
                         self.rect.topleft = self.position.as_xy_tuple()
-                        # entites sorted by layer, last is in front
-                        for entity in reversed(world.get_entities_in_region(self.rect)):
-                            # only do something if we hit an entity different from last time
-                            if entity.hit(self.position):
-                                # check if entity is hit
-                                if entity != self and entity != self.hover_entity:
-                                    # replace
-                                    if self.hover_entity: # may be None
-                                        self.hover_entity.on_screenmouse_leave(self.position, dragging)
-                                    self.hover_entity = entity
-                                    entity.on_screenmouse_enter(self.position, dragging)
-                                return
-                            else:
-                                if self.hover_entity:
-                                    self.hover_entity.on_screenmouse_leave(self.position, dragging)
-                                    self.hover_entity = None
+                        world.update_entity(self)
+                        # the hover entity is picked later in update_hover
+                        self._hover_pending = (world, dragging)
                         self.events.screenmouse_motion(self.position, self.hover_renderer.screen_to_world(Vec3(*rel)))
                     else:
                         # FIXME: TODO: this isnt a good nor elegant solution!!
@@ -187,20 +178,40 @@ class ScreenMouse(pyknic.entity.Entity):
                         self.position = Vec3(-99999, -99999, -99999)
                     return
             # either no world or no entity.hit() return True
-            if self.hover_entity:
-                self.hover_entity.on_screenmouse_leave(self.position, self.is_dragging)
-                self.hover_entity = None
+            self._hover_pending = (None, self.is_dragging)
         if self.hover_renderer:
             self.hover_renderer.on_screenmouse_leave(self.screen_pos, self.is_dragging)
             self.hover_renderer = None
 
+    def update_hover(self):
+        u"""
+        Picks the topmost entity hit at the last mouse position and sends
+        the enter/leave events if it has changed. Does nothing if the mouse
+        has not moved since the last call.
+        """
+        if self._hover_pending is None:
+            return
+        world, dragging = self._hover_pending
+        self._hover_pending = None
+        entity = None
+        if world is not None:
+            entity = world.get_entity_at(self.position, self)
+        if entity is not self.hover_entity:
+            if self.hover_entity: # may be None
+                self.hover_entity.on_screenmouse_leave(self.position, dragging)
+            self.hover_entity = entity
+            if entity:
+                entity.on_screenmouse_enter(self.position, dragging)
+
     def on_mouse_button_down(self, pos, buttons, mods):
+        self.update_hover()
         if self.hover_renderer:
             if self.hover_entity:
                 self.hover_entity.on_screenmouse_button_down(self.position, buttons, mods)
             self.events.screenmouse_button_down(self.position, buttons, mods)
 
     def on_mouse_button_up(self, pos, buttons, mods):
+        self.update_hover()
         if self.hover_renderer:
             if self.hover_entity:
                 self.hover_entity.on_screenmouse_button_up(self.position, buttons, mods)
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+u"""
+Batched integration of the movement of many entities.
+
+Instead of integrating each entity on its own, the positions, velocities,
+accelerations and time dilation factors of all registered entities are
+gathered into contiguous arrays, integrated in one step and only the
+entities that actually move (or stop) are written back. numpy is used if
+it is available, otherwise the arrays are array.array and the step is done
+in pure python.
+
+The entities stay the owners of their data, so game code can still change
+velocity, position and so on as before. Entities need a `moving` vector
+attribute like the movers of the game.
+
+:Note:
+    This is a batched step, not a persistent struct of arrays. The arrays
+    are gathered again for each step, because game code changes and even
+    replaces the vectors of the entities (e.g. in collision responses) at
+    any time, so arrays kept between the steps would go stale. The gather
+    is done with map and attrgetter, so the python code per entity left is
+    the write back of the ones that have moved.
+"""
+
+__version__ = '$Id$'
+
+if __debug__:
+    import sys
+    sys.stdout.write(u'%s loading ... \n' % (__name__))
+    import time
+    _start_time = time.time()
+
+from array import array
+from operator import attrgetter
+
+try:
+    # optional, the pure python step is used without it
+    import numpy
+except ImportError:
+    numpy = None
+
+#-------------------------------------------------------------------------------
+
+_get_t_speed = attrgetter('t_speed')
+_get_position = attrgetter('_position')
+_get_velocity = attrgetter('velocity')
+_get_acceleration = attrgetter('acceleration')
+_get_moving = attrgetter('moving')
+
+class Kinematics(object):
+    u"""
+    Integrates the registered entities axis by axis, like::
+
+        kinematics.integrate_x(gdt)
+        # collision check
+        kinematics.integrate_y(gdt)
+        # collision check
+
+    Each step does for the axis (here x) the same as::
+
+        dt = gdt * entity.t_speed
+        entity.velocity.x += entity.t_speed * dt * entity.acceleration.x
+        entity.position.x += entity.t_speed * dt * entity.velocity.x
+        entity.moving.x = entity.velocity.x
+        entity.moving.y = 0
+        entity.rect.center = entity.position.as_xy_tuple()
+
+    but the entity is only touched if this changes something. Entities
+    with a target are skipped.
+    """
+
+    def __init__(self, use_numpy=True):
+        u"""
+        Constructor.
+
+        :Parameters:
+            use_numpy : bool
+                use numpy for the step if it is available
+        """
+        self.use_numpy = use_numpy and numpy is not None
+        self._entities = []
+        self._slots = {} # {entity: index in _entities}
+
+    def add(self, entity):
+        u"""
+        Registers an entity, does nothing if it is already registered.
+        """
+        if entity not in self._slots:
+            self._slots[entity] = len(self._entities)
+            self._entities.append(entity)
+
+    def remove(self, entity):
+        u"""
+        Unregisters an entity, does nothing if it is not registered.
+        """
+        slot = self._slots.pop(entity, None)
+        if slot is not None:
+            # move the last one into the gap
+            last = self._entities.pop()
+            if last is not entity:
+                self._entities[slot] = last
+                self._slots[last] = slot
+
+    def __contains__(self, entity):
+        return entity in self._slots
+
+    def __len__(self):
+        return len(self._entities)
+
+    def integrate_x(self, gdt):
+        u"""
+        Moves all entities along the x-axis.
+
+        :Parameters:
+            gdt : float
+                game delta time
+
+        :Returns:
+            list of the entities that have been written back
+        """
+        return self._integrate(gdt, 'x', 'y')
+
+    def integrate_y(self, gdt):
+        u"""
+        Moves all entities along the y-axis, see `integrate_x`.
+        """
+        return self._integrate(gdt, 'y', 'x')
+
+    def _integrate(self, gdt, axis, other):
+        entities = [entity for entity in self._entities if entity._target is None]
+        if not entities:
+            return []
+        get_axis = attrgetter(axis)
+        get_other = attrgetter(other)
+        # gather, the vectors are fetched once and reused for the write back
+        position_vecs = map(_get_position, entities)
+        velocity_vecs = map(_get_velocity, entities)
+        moving_vecs = map(_get_moving, entities)
+        positions = array('d', map(get_axis, position_vecs))
+        velocities = array('d', map(get_axis, velocity_vecs))
+        accelerations = array('d', map(get_axis, map(_get_acceleration, entities)))
+        t_speeds = array('d', map(_get_t_speed, entities))
+        movings = array('d', map(get_axis, moving_vecs))
+        others = array('d', map(get_other, moving_vecs))
+        # step
+        if self.use_numpy:
+            changed, velocities, positions = _step_numpy(gdt, positions, velocities, \
+                                        accelerations, t_speeds, movings, others)
+        else:
+            changed, velocities, positions = _step(gdt, positions, velocities, \
+                                        accelerations, t_speeds, movings, others)
+        # write back
+        moved = []
+        append = moved.append
+        for idx, accelerated in changed:
+            entity = entities[idx]
+            position = position_vecs[idx]
+            velocity = velocity_vecs[idx]
+            moving = moving_vecs[idx]
+            if axis == 'x':
+                if accelerated:
+                    velocity.x = velocities[idx]
+                position.x = positions[idx]
+                moving.x = velocity.x
+                moving.y = 0
+            else:
+                if accelerated:
+                    velocity.y = velocities[idx]
+                position.y = positions[idx]
+                moving.x = 0
+                moving.y = velocity.y
+            entity._rect.center = (position.x, position.y)
+            # same as entity.dirty = 1, without the property calls
+            entity._dirty = 1
+            if entity._dirty_set is not None:
+                entity._dirty_set.add(entity)
+            append(entity)
+        return moved
+
+#-------------------------------------------------------------------------------
+
+def _step(gdt, positions, velocities, accelerations, t_speeds, movings, others):
+    # pure python step, returns ([(idx, accelerated)], velocities, positions)
+    changed = []
+    for idx in xrange(len(positions)):
+        t_speed = t_speeds[idx]
+        scale = t_speed * (gdt * t_speed)
+        delta_v = scale * accelerations[idx]
+        velocity = velocities[idx] + delta_v
+        delta_p = scale * velocity
+        if delta_v or delta_p or velocity != movings[idx] or others[idx]:
+            velocities[idx] = velocity
+            positions[idx] += delta_p
+            changed.append((idx, delta_v != 0))
+    return changed, velocities, positions
+
+def _step_numpy(gdt, positions, velocities, accelerations, t_speeds, movings, others):
+    # same as _step, but vectorized
+    t_speeds = numpy.frombuffer(t_speeds)
+    scale = t_speeds * (gdt * t_speeds)
+    delta_v = scale * numpy.frombuffer(accelerations)
+    velocities = numpy.frombuffer(velocities) + delta_v
+    delta_p = scale * velocities
+    positions = numpy.frombuffer(positions) + delta_p
+    mask = (delta_v != 0) | (delta_p != 0) | (velocities != numpy.frombuffer(movings)) | \
+                                                    (numpy.frombuffer(others) != 0)
+    indices = numpy.flatnonzero(mask)
+    changed = zip(indices.tolist(), (delta_v[indices] != 0).tolist())
+    return changed, velocities.tolist(), positions.tolist()
+
+#-------------------------------------------------------------------------------
+
+if __debug__:
+    _dt = time.time() - _start_time
+    sys.stdout.write(u'%s loaded: %fs \n' % (__name__, _dt))
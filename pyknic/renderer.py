@@ -45,7 +45,11 @@ class IRenderer(entity.Entity):
             a vector that point to the center of the screen rect ( Vec3(w//2, h//2) )
         screen_pos : `Vec3`
             The topleft corner of rect
-        
+        dirty_rects : `DirtyRects`
+            If set, the renderer should report the regions of the screen it
+            has changed to it and may leave the unchanged ones as they are.
+            Default: None, the whole rect is drawn each frame
+
     :TODO:
         screen_pos should be read only
     
@@ -75,6 +79,7 @@ class IRenderer(entity.Entity):
         self.vec_center = Vec3(screen_rect.w // 2,  screen_rect.h // 2)
         # TODO: moving the rect should upldate screen_pos
         self.screen_pos = Vec3(self.rect.topleft[0],  self.rect.topleft[1])
+        self.dirty_rects = None
 
     world = property(lambda self: self._world, doc=u'''get the world this renderer belongs, read only''')
 
@@ -146,8 +151,192 @@ class IRenderer(entity.Entity):
             self.position = self.target.position
         self.world_rect.center = self.position.as_xy_tuple()
 
+    #-- world notifications --#
+    def on_entity_added(self, entity):
+        u"""
+        Called by the world when an entity has been added, also for the
+        entities already in the world when the renderer is added.
+        """
+        pass
+
+    def on_entity_removed(self, entity):
+        u"""
+        Called by the world when an entity has been removed, also for all
+        entities when the renderer is removed.
+        """
+        pass
+
+    def on_entities_changed(self, entities):
+        u"""
+        Called by the world with the entities that have been marked dirty 
+        since the last update of the world.
+        """
+        pass
+
+#-------------------------------------------------------------------------------
+
+class DirtyRects(object):
+    u"""
+    Collects the regions of the screen that have changed during a frame.
+    `update` pushes only those to the display instead of the whole screen,
+    so frames with little change cost little::
+
+        dirty_rects.add(rect) # for each changed region
+        dirty_rects.update()  # instead of pygame.display.flip()
+
+    If there are many regions or they cover a big part of the screen, the
+    whole screen is pushed at once, which is cheaper then.
+    """
+
+    def __init__(self, screen_rect, max_rects=32, max_fraction=0.5):
+        u"""
+        Constructor.
+
+        :Parameters:
+            screen_rect : Rect
+                the rect of the screen, the regions are clipped to it
+            max_rects : int
+                with more regions the whole screen is pushed
+            max_fraction : float
+                if the regions cover more of the screen than this, the
+                whole screen is pushed
+        """
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.max_rects = max_rects
+        self.max_area = max_fraction * self.screen_rect.w * self.screen_rect.h
+        self._rects = []
+        self._area = 0
+        self._full = False
+
+    full = property(lambda self: self._full, doc=u'''True if the whole screen will be pushed, read only''')
+
+    def add(self, rect):
+        u"""
+        Marks a region of the screen as changed.
+
+        :Parameters:
+            rect : Rect
+                the region in screen coordinates
+        """
+        if self._full:
+            return
+        rect = self.screen_rect.clip(rect)
+        if rect.w and rect.h:
+            self._rects.append(rect)
+            self._area += rect.w * rect.h
+            if len(self._rects) > self.max_rects or self._area > self.max_area:
+                self.add_all()
+
+    def add_all(self):
+        u"""
+        Marks the whole screen as changed.
+        """
+        self._full = True
+        self._rects = []
+        self._area = 0
+
+    def update(self, update=pygame.display.update, flip=pygame.display.flip):
+        u"""
+        Pushes the changed regions to the display and starts over.
+
+        :Returns:
+            list of the pushed rects, empty if nothing has changed
+        """
+        if self._full:
+            flip()
+            rects = [self.screen_rect]
+        else:
+            rects = self._rects
+            if rects:
+                update(rects)
+        self._rects = []
+        self._area = 0
+        self._full = False
+        return rects
+
 #-------------------------------------------------------------------------------
 
+class DrawList(object):
+    u"""
+    The draw order keys of the entities: layer - position.z and, for 
+    entities with the same value, the order they have been added or their
+    key changed. Sorting the entities to draw by `key` gives them bottom up.
+    
+    The keys are kept between frames, only the entities passed to `update`
+    are checked and get a new key if their value has changed. Adding, 
+    removing and updating an entity is O(1). The visible entities are 
+    sorted once per frame by the region query of the world::
+
+        ents = world.get_entities_in_region(rect, draw_list.key)
+    """
+
+    def __init__(self, entities=[]):
+        u"""
+        Constructor.
+        
+        :Parameters:
+            entities : iterable
+                entities to add
+        """
+        self._keys = {} # {entity: (layer - z, seq)}
+        self._seq = 0
+        self._order = None # all entities sorted, until a key changes
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        u"""
+        Adds an entity as the last one with its key, does nothing if it is
+        already in.
+        """
+        if entity not in self._keys:
+            self._keys[entity] = (entity.layer - entity.position.z, self._seq)
+            self._seq += 1
+            self._order = None
+
+    def remove(self, entity):
+        u"""
+        Removes an entity, does nothing if it is not in.
+        """
+        if self._keys.pop(entity, None):
+            self._order = None
+
+    def update(self, entities):
+        u"""
+        Gives the entities which value has changed a new key, as the last 
+        ones with that value.
+        
+        :Parameters:
+            entities : iterable
+                entities that may have changed, the ones not in are ignored
+        """
+        _keys = self._keys
+        for entity in entities:
+            key = _keys.get(entity)
+            if key and key[0] != entity.layer - entity.position.z:
+                _keys[entity] = (entity.layer - entity.position.z, self._seq)
+                self._seq += 1
+                self._order = None
+
+    def key(self, entity):
+        u"""
+        Returns the sort key of the entity, e.g. to sort the entities to
+        draw: entities.sort(key=draw_list.key)
+        """
+        return self._keys[entity]
+
+    def __iter__(self):
+        u"""iterates all entities in draw order, sorted only after changes"""
+        if self._order is None:
+            self._order = sorted(self._keys, key=self._keys.__getitem__)
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, entity):
+        return entity in self._keys
+
 
 
 
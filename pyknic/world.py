@@ -24,6 +24,8 @@ if __debug__:
     import time
     _start_time = time.time()
 
+from collections import OrderedDict
+
 import pyknic
 import pygame
 
@@ -47,18 +49,51 @@ class IWorld(object):
             The layer of this world. Normally not used, but if you have more
             than one world on screen at the same time, this is used to
             find the order in which the worlds are traversed by the mouse.
-        _entities : `SortedList`
-            A sorted list of all entities of thies world. Sort oder: layer, bottom up
+        _entities : list
+            A sorted list of all entities of thies world. Sort oder: layer, bottom up,
+            entities on the same layer in the order they have been added.
+            Read only, it is sorted again only after entities have been
+            added, removed or changed their layer.
+        _handles : dict
+            The registry of the entities, {entity: (layer, seq)}, the key of
+            each entity in _entities. Used for O(1) membership tests, adding
+            and removing.
         _renderers : `SortedList`
             A worted list of all renderers that render this world. Sort order: layer, top down
+            The renderers are notified about added, removed and changed 
+            entities, see `IRenderer.on_entity_added`.
+        _index : `SpatialGrid`
+            The spatial index of the entities for the region queries. 
+            Implementations should use `_register` and `_unregister` to keep
+            it in sync.
+        _dirty_entities : set
+            The entities marked dirty since the last `update_entities`.
+        _awake : set
+            The entities that can sleep and are awake.
+        _asleep : set
+            The entities that have been put to sleep.
 
     """
 
     def __init__(self, *args,  **kwargs):
-        self._entities = utilities.SortedList(key=lambda ent: ent.layer)
+        self._handles = {}
+        self._seq = 0
+        self._sorted = None # the entities sorted by _handles, until one changes
         self._renderers = utilities.SortedList(key=lambda ent: -ent.layer)
+        self._index = SpatialGrid(key=self._handles.__getitem__)
+        self._dirty_entities = set()
+        self._activity = None # (center, radius, margin)
+        self._awake = set()
+        self._asleep = set()
         self.layer = 0
 
+    def _get_entities(self):
+        if self._sorted is None:
+            self._sorted = sorted(self._handles, key=self._handles.__getitem__)
+        return self._sorted
+
+    _entities = property(_get_entities, doc=u'''all entities sorted by layer, bottom up, read only''')
+
     #-- entities --#
     def add_entity(self, entity):
         u"""
@@ -86,10 +121,11 @@ class IWorld(object):
         """
         raise NotImplementedError()
 
-    def get_entities_in_region(self, world_rect):
+    def get_entities_in_region(self, world_rect, key=None):
         u"""
         Returns a ordered list of entites to of this region of the world. 
-        The list is ordered by entites layer attribute, bottom up. 
+        The list is ordered by entites layer attribute, bottom up, or by 
+        key if it is given.
         
         :Note:
             This method has to be overriden and implemented.
@@ -104,10 +140,202 @@ class IWorld(object):
         :Parameters:
             world_rect : Rect
                 A rect in world coordinates.
+            key : function
+                Sort key for the entities, e.g. `DrawList.key`.
         
         """
         raise NotImplementedError()
 
+    def has_entity(self, entity):
+        u"""
+        Returns True if the entity is in this world, O(1).
+        """
+        return entity in self._handles
+
+    def _register(self, entity):
+        u"""
+        Adds the entity to the registry, the sorted entities and the spatial
+        index. Does nothing if it is already in this world. To be used by 
+        the add_entity implementations.
+        
+        :Returns:
+            True if the entity has been added
+        """
+        if entity in self._handles:
+            return False
+        self._handles[entity] = (entity.layer, self._seq)
+        self._seq += 1
+        self._sorted = None
+        self._index.add(entity)
+        entity._dirty_set = self._dirty_entities
+        if entity.can_sleep:
+            self._awake.add(entity)
+        for renderer in self._renderers:
+            renderer.on_entity_added(entity)
+        return True
+
+    def _unregister(self, entity):
+        u"""
+        Removes the entity from the registry, the sorted entities and the
+        spatial index. Does nothing if it is not in this world. To be used
+        by the remove_entity implementations.
+        
+        :Returns:
+            True if the entity has been removed
+        """
+        if entity not in self._handles:
+            return False
+        del self._handles[entity]
+        self._sorted = None
+        self._index.remove(entity)
+        self._dirty_entities.discard(entity)
+        if entity._dirty_set is self._dirty_entities:
+            entity._dirty_set = None
+        self._awake.discard(entity)
+        self._asleep.discard(entity)
+        for renderer in self._renderers:
+            renderer.on_entity_removed(entity)
+        return True
+
+    def update_entity(self, entity):
+        u"""
+        Updates the place of the entity in the spatial index after its rect
+        has changed, so region queries find it at the new place right away
+        instead of after the next `update_entities`.
+        
+        :Parameters:
+            entity : `Entity`
+                Entity that has moved.
+        """
+        self._index.update(entity)
+
+    def update_entities(self):
+        u"""
+        Updates the spatial index and the layer order of the entities 
+        marked dirty since the last call and clears their dirty flag. 
+        Entities that have not changed cost nothing.
+        """
+        dirty = self._dirty_entities
+        if not dirty:
+            return
+        _index = self._index
+        _handles = self._handles
+        for entity in dirty:
+            _index.update(entity)
+            if entity.layer != _handles[entity][0]:
+                # sorted in again as the last one on its new layer
+                _handles[entity] = (entity.layer, self._seq)
+                self._seq += 1
+                self._sorted = None
+            entity.dirty = 0
+        for renderer in self._renderers:
+            renderer.on_entities_changed(dirty)
+        dirty.clear()
+
+    def update(self, *args, **kwargs):
+        u"""
+        Same as `update_entities` followed by `update_activity`, but can be 
+        registered like the update method of an entity. It should run after
+        everything has moved.
+        """
+        self.update_entities()
+        if self._activity:
+            self.update_activity()
+
+    #-- activity --#
+    def set_activity_region(self, center, radius, margin=64):
+        u"""
+        Sets the region in which the entities that can sleep are awake. 
+        Outside of it they are put to sleep by `update_activity`, so the 
+        cost per frame follows what is near the center instead of the 
+        size of the world.
+        
+        :Parameters:
+            center : object
+                anything with a position, like the player or a renderer
+            radius : int
+                half the width of the square region around the center, 
+                None to wake all entities and stop putting them to sleep
+            margin : int
+                entities are put to sleep only if they are this much 
+                further away, so they do not toggle at the border
+        """
+        if radius is None:
+            self._activity = None
+            for entity in list(self._asleep):
+                self.wake(entity)
+        else:
+            self._activity = (center, radius, margin)
+
+    def update_activity(self):
+        u"""
+        Wakes the sleeping entities that have entered the activity region 
+        and puts the awake ones to sleep that have left it (or have been
+        added outside of it). Costs one region query, which only looks at 
+        the cells of the region, so it does not grow with the world.
+        """
+        center, radius, margin = self._activity
+        position = center.position
+        region = pygame.Rect(position.x - radius, position.y - radius, 2 * radius, 2 * radius)
+        nearby = self._index.query(region.inflate(2 * margin, 2 * margin))
+        _asleep = self._asleep
+        for entity in nearby:
+            if entity in _asleep and region.colliderect(entity.rect):
+                self.wake(entity)
+        for entity in self._awake.difference(nearby):
+            if entity.can_sleep:
+                self._awake.remove(entity)
+                _asleep.add(entity)
+                entity.sleep()
+
+    def wake(self, entity):
+        u"""
+        Wakes a sleeping entity, e.g. on an alarm. If it is still outside of
+        the activity region it is put to sleep again by the next 
+        `update_activity` unless its can_sleep is set to False.
+        
+        :Parameters:
+            entity : `Entity`
+                An entity of this world.
+        """
+        if entity in self._asleep:
+            self._asleep.remove(entity)
+            self._awake.add(entity)
+            entity.wake()
+
+    def is_asleep(self, entity):
+        u"""
+        Returns True if the entity has been put to sleep by this world.
+        """
+        return entity in self._asleep
+
+    def get_entities_at(self, world_coord):
+        u"""
+        Returns the entities which rect contains the point, ordered by
+        layer, bottom up. Faster than a region query.
+        
+        :Parameters:
+            world_coord : `Vec3`
+                The point in world coordinates.
+        """
+        return self._index.query_point(world_coord.x, world_coord.y)
+
+    def get_entity_at(self, world_coord, exclude=None):
+        u"""
+        Returns the topmost entity at the point which hit() method returns
+        True or None.
+        
+        :Parameters:
+            world_coord : `Vec3`
+                The point in world coordinates.
+            exclude : `Entity`
+                An entity to ignore, e.g. the mouse itself.
+        """
+        for entity in reversed(self._index.query_point(world_coord.x, world_coord.y)):
+            if entity is not exclude and entity.hit(world_coord):
+                return entity
+        return None
+
     #-- renderers --#
     def add_renderer(self, renderer):
         u"""
@@ -119,6 +347,8 @@ class IWorld(object):
         """
         self._renderers.append(renderer)
         renderer._world = self
+        for entity in self._entities:
+            renderer.on_entity_added(entity)
 
     def remove_renderer(self, renderer):
         u"""
@@ -132,6 +362,8 @@ class IWorld(object):
         if renderer in self._renderers:
             self._renderers.remove(renderer)
             renderer._world = None
+            for entity in self._entities:
+                renderer.on_entity_removed(entity)
 
     def get_renderers(self):
         u"""
@@ -215,6 +447,304 @@ class IWorld(object):
         raise NotImplementedError(u'Not implemented method of IWorld')
 
 
+#-------------------------------------------------------------------------------
+
+class SpatialGrid(object):
+    u"""
+    A uniform grid of entities for region queries. Each entity is stored in
+    the cells its rect covers, entities covering more than max_cells cells 
+    (like full map layers) are kept aside and tested on each query. A 
+    query looks only at the cells its rect covers, however big it is.
+    
+    The grid does not notice when an entity moves, `update` or `update_all`
+    has to be called.
+    """
+
+    def __init__(self, cell_size=128, max_cells=64, key=None):
+        u"""
+        Constructor.
+        
+        :Parameters:
+            cell_size : int
+                width and height of a cell in world coordinates
+            max_cells : int
+                entities covering more cells are not bucketed
+            key : function
+                sort key for the query results, default: layer and the 
+                order the entities have been added
+        """
+        self.key = key
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self._cells = {}    # {(cx, cy): set(entity)}
+        self._large = set() # entities covering more than max_cells cells
+        self._handles = {}  # {entity: [seq, rect tuple, cells or None for large]}
+        self._seq = 0
+
+    def _cell_range(self, rect):
+        # (left, right, top, bottom) of the cells covered by rect, inclusive
+        cell_size = self.cell_size
+        return (rect.left // cell_size, max(rect.right - 1, rect.left) // cell_size, \
+                rect.top // cell_size, max(rect.bottom - 1, rect.top) // cell_size)
+
+    def _cells_of(self, rect):
+        # the cells to store an entity in, None if there are too many
+        left, right, top, bottom = self._cell_range(rect)
+        if (right - left + 1) * (bottom - top + 1) > self.max_cells:
+            return None
+        return [(cx, cy) for cx in xrange(left, right + 1) for cy in xrange(top, bottom + 1)]
+
+    def _insert(self, entity, cells):
+        if cells is None:
+            self._large.add(entity)
+        else:
+            _cells = self._cells
+            for cell in cells:
+                if cell in _cells:
+                    _cells[cell].add(entity)
+                else:
+                    _cells[cell] = set([entity])
+
+    def _discard(self, entity, cells):
+        if cells is None:
+            self._large.discard(entity)
+        else:
+            _cells = self._cells
+            for cell in cells:
+                bucket = _cells[cell]
+                bucket.discard(entity)
+                if not bucket:
+                    del _cells[cell]
+
+    def add(self, entity):
+        u"""
+        Adds an entity. Adding it again is the same as `update`.
+        """
+        if entity in self._handles:
+            self.update(entity)
+            return
+        cells = self._cells_of(entity.rect)
+        self._insert(entity, cells)
+        self._handles[entity] = [self._seq, tuple(entity.rect), cells]
+        self._seq += 1
+
+    def remove(self, entity):
+        u"""
+        Removes an entity, does nothing if it is not in the grid.
+        """
+        handle = self._handles.pop(entity, None)
+        if handle:
+            self._discard(entity, handle[2])
+
+    def update(self, entity):
+        u"""
+        Moves the entity to the cells of its current rect if it has changed.
+        """
+        handle = self._handles[entity]
+        rect = entity.rect
+        if tuple(rect) != handle[1]:
+            handle[1] = tuple(rect)
+            cells = self._cells_of(rect)
+            if cells != handle[2]:
+                self._discard(entity, handle[2])
+                self._insert(entity, cells)
+                handle[2] = cells
+
+    def update_all(self):
+        u"""
+        Calls `update` for all entities.
+        """
+        update = self.update
+        for entity in self._handles.keys():
+            update(entity)
+
+    def query(self, rect, key=None):
+        u"""
+        Returns the entities colliding with rect ordered by layer, bottom up.
+        Entities on the same layer are in the order they have been added.
+        If a key has been given, they are sorted using it instead.
+        
+        :Parameters:
+            rect : Rect
+                the region in world coordinates
+            key : function
+                sort key for this query, default: the key of the grid
+        
+        :Returns:
+            list of entities
+        """
+        found = set(self._large)
+        _cells = self._cells
+        left, right, top, bottom = self._cell_range(rect)
+        if (right - left + 1) * (bottom - top + 1) <= len(_cells):
+            _get = _cells.get
+            for cx in xrange(left, right + 1):
+                for cy in xrange(top, bottom + 1):
+                    bucket = _get((cx, cy))
+                    if bucket:
+                        found.update(bucket)
+        else:
+            # fewer occupied cells than cells in the range
+            for (cx, cy), bucket in _cells.iteritems():
+                if left <= cx <= right and top <= cy <= bottom:
+                    found.update(bucket)
+        key = key or self.key
+        if key:
+            hits = [entity for entity in found if rect.colliderect(entity.rect)]
+            hits.sort(key=key)
+            return hits
+        _handles = self._handles
+        hits = [(entity.layer, _handles[entity][0], entity) for entity in found if rect.colliderect(entity.rect)]
+        hits.sort()
+        return [entity for layer, seq, entity in hits]
+
+    def query_point(self, x, y):
+        u"""
+        Returns the entities which rect contains the point, in the same 
+        order as `query`. Only one cell is looked at.
+        
+        :Parameters:
+            x, y : int
+                the point in world coordinates
+        
+        :Returns:
+            list of entities
+        """
+        found = set(self._large)
+        bucket = self._cells.get((int(x) // self.cell_size, int(y) // self.cell_size))
+        if bucket:
+            found.update(bucket)
+        point = (x, y)
+        hits = [entity for entity in found if entity.rect.collidepoint(point)]
+        if self.key:
+            hits.sort(key=self.key)
+            return hits
+        _handles = self._handles
+        hits = [(entity.layer, _handles[entity][0], entity) for entity in hits]
+        hits.sort()
+        return [entity for layer, seq, entity in hits]
+
+    def __contains__(self, entity):
+        return entity in self._handles
+
+    def __len__(self):
+        return len(self._handles)
+
+#-------------------------------------------------------------------------------
+
+class ChunkStreamer(object):
+    u"""
+    Streams a big world in square chunks. The chunks around a view rect 
+    (normally the camera) are loaded, the least recently needed ones are 
+    unloaded again as soon as the resident size exceeds the budget. Chunks
+    that are needed are never unloaded, even if this exceeds the budget.
+    
+    What a chunk is, is up to the load and unload functions::
+    
+        def load(key): # key is (cx, cy), the world rect is chunk_rect(key)
+            ...
+            return data, size # size in bytes, counted against the budget
+            
+        def unload(key, data):
+            ...
+    
+    """
+
+    def __init__(self, chunk_size, load, unload, budget=64 * 2 ** 20, margin=0):
+        u"""
+        Constructor.
+        
+        :Parameters:
+            chunk_size : int
+                width and height of a chunk in world coordinates
+            load : function
+                load(key) -> (data, size), loads a chunk
+            unload : function
+                unload(key, data), unloads a chunk
+            budget : int
+                the resident size in bytes above which chunks are unloaded
+            margin : int
+                the view rect is inflated by this on each side, so the 
+                chunks are loaded before they become visible
+        """
+        self.chunk_size = chunk_size
+        self.load = load
+        self.unload = unload
+        self.budget = budget
+        self.margin = margin
+        self.resident = 0
+        self._chunks = OrderedDict() # {key: (data, size)}, least recently needed first
+
+    def chunk_of(self, x, y):
+        u"""
+        Returns the key of the chunk containing the point.
+        """
+        return (int(x) // self.chunk_size, int(y) // self.chunk_size)
+
+    def chunk_rect(self, key):
+        u"""
+        Returns the rect of the chunk in world coordinates.
+        """
+        size = self.chunk_size
+        return pygame.Rect(key[0] * size, key[1] * size, size, size)
+
+    def chunks_in(self, rect):
+        u"""
+        Returns the keys of the chunks touched by the rect, row by row.
+        """
+        size = self.chunk_size
+        left = rect.left // size
+        right = max(rect.right - 1, rect.left) // size
+        top = rect.top // size
+        bottom = max(rect.bottom - 1, rect.top) // size
+        return [(cx, cy) for cy in xrange(top, bottom + 1) for cx in xrange(left, right + 1)]
+
+    def update(self, view_rect):
+        u"""
+        Loads the missing chunks around the view rect and unloads the least
+        recently needed chunks until the budget is met again.
+        
+        :Parameters:
+            view_rect : Rect
+                the visible region in world coordinates
+        """
+        margin = self.margin
+        needed = self.chunks_in(view_rect.inflate(2 * margin, 2 * margin))
+        _chunks = self._chunks
+        for key in needed:
+            if key in _chunks:
+                # mark as the most recently needed
+                _chunks[key] = _chunks.pop(key)
+            else:
+                data, size = self.load(key)
+                _chunks[key] = (data, size)
+                self.resident += size
+        if self.resident > self.budget:
+            needed = set(needed)
+            for key in _chunks.keys():
+                if self.resident <= self.budget or key in needed:
+                    # the needed ones are the most recent, so all are at the end
+                    break
+                self._evict(key)
+
+    def _evict(self, key):
+        data, size = self._chunks.pop(key)
+        self.resident -= size
+        self.unload(key, data)
+
+    def unload_all(self):
+        u"""
+        Unloads all chunks.
+        """
+        for key in self._chunks.keys():
+            self._evict(key)
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    def __len__(self):
+        return len(self._chunks)
+
 #-------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------
 